@@ -2,13 +2,42 @@
 """Export aggregated git data to JSON for the dashboard."""
 
 import argparse
-import json
 import os
+import sqlite3
+import subprocess
+import time
+import zlib
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import closing
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
 
-import pandas as pd
-from git import Repo
+import numpy as np
+import orjson
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Anything that changes what a cached row means goes into the stamp checked by open_cache.
+DIFF_FLAGS = ["--numstat", "--no-renames", "--diff-merges=first-parent"]
+CACHE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS stats"
+    " (sha TEXT PRIMARY KEY, insertions INTEGER, deletions INTEGER, files INTEGER)"
+)
+CACHE_VERSION = zlib.crc32(" ".join([CACHE_SCHEMA, *DIFF_FLAGS]).encode()) & 0x7FFFFFFF
+
+
+@dataclass(slots=True)
+class CommitRecord:
+    """One entry of the dashboard's ``commits`` list."""
+
+    hash: str
+    author: str
+    timestamp: np.datetime64
+    insertions: int
+    deletions: int
+    files: int
 
 
 def parse_args() -> argparse.Namespace:
@@ -24,6 +53,16 @@ def parse_args() -> argparse.Namespace:
         default="dashboard/public/data/git-data.json",
         help="Output JSON file path",
     )
+    parser.add_argument(
+        "--cache",
+        default=".gitreport/cache.sqlite",
+        help="SQLite file caching per-commit stats between runs",
+    )
+    parser.add_argument(
+        "--include-merges",
+        action="store_true",
+        help="Count merge commits too (diffed against their first parent)",
+    )
     return parser.parse_args()
 
 
@@ -35,69 +74,172 @@ def resolve_since(since_string: str) -> str:
         return since_string
 
 
-def main() -> None:
-    args = parse_args()
-    repo_path = os.path.abspath(args.repo)
-    repo = Repo(repo_path)
-    since = resolve_since(args.since)
-
-    commits = []
-    for commit in repo.iter_commits("--all", since=since):
-        commits.append(
-            {
-                "hash": commit.hexsha,
-                "author": commit.author.name,
-                "timestamp": datetime.fromtimestamp(commit.committed_date).isoformat(),
-                "insertions": commit.stats.total["insertions"],
-                "deletions": commit.stats.total["deletions"],
-                "files": commit.stats.total["files"],
-            }
+def iter_git_lines(repo_path: str, args: list[str], stdin: str | None = None) -> Iterator[str]:
+    """Run ``git`` in ``repo_path`` and yield its stdout one line at a time."""
+    # The context manager closes the pipes and reaps git even if the caller stops early.
+    with subprocess.Popen(
+        ["git", *args],
+        cwd=repo_path,
+        stdin=subprocess.PIPE if stdin is not None else None,
+        stdout=subprocess.PIPE,
+    ) as proc:
+        if stdin is not None:
+            # git reads every revision from stdin before it starts printing.
+            proc.stdin.write(stdin.encode())
+            proc.stdin.close()
+        for raw in proc.stdout:
+            yield raw.decode("utf-8", "replace").rstrip("\n")
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+
+def open_cache(path: Path) -> sqlite3.Connection:
+    """Open the per-commit stats cache, dropping it if its stamp is stale."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(path)
+    if con.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+        con.execute("DROP TABLE IF EXISTS stats")
+        con.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+    con.execute(CACHE_SCHEMA)
+    return con
+
+
+def shallow_commits(repo_path: str) -> set[str]:
+    """Return the boundary commits of a shallow clone, whose stats are not final."""
+    shallow = Path(repo_path, list(iter_git_lines(repo_path, ["rev-parse", "--git-path", "shallow"]))[0])
+    return set(shallow.read_text().split()) if shallow.exists() else set()
+
+
+def cached_stats(con: sqlite3.Connection, shas: list[str]) -> dict[str, tuple[int, int, int]]:
+    """Return the cached ``(insertions, deletions, files)`` for ``shas``."""
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (sha TEXT PRIMARY KEY)")
+    con.execute("DELETE FROM wanted")
+    con.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((sha,) for sha in shas))
+    rows = con.execute("SELECT sha, insertions, deletions, files FROM stats JOIN wanted USING (sha)")
+    return {sha: (ins, dels, files) for sha, ins, dels, files in rows}
+
+
+def diff_stats(repo_path: str, shas: list[str]) -> dict[str, tuple[int, int, int]]:
+    """Compute ``(insertions, deletions, files)`` for ``shas`` with one ``git log``."""
+    args = [
+        "log",
+        "--stdin",
+        "--no-walk=unsorted",
+        *DIFF_FLAGS,
+        "--format=%x01%H",
+    ]
+    stats = {}
+    counts = None
+    for line in iter_git_lines(repo_path, args, stdin="\n".join(shas) + "\n"):
+        if line.startswith("\x01"):
+            counts = stats[line[1:]] = [0, 0, 0]
+        elif line:
+            added, removed, _ = line.split("\t", 2)
+            # Binary files report "-" for both counts.
+            counts[0] += int(added) if added != "-" else 0
+            counts[1] += int(removed) if removed != "-" else 0
+            counts[2] += 1
+    return {sha: tuple(counts) for sha, counts in stats.items()}
+
+
+def collect_commits(
+    repo_path: str, since: str, cache: sqlite3.Connection, include_merges: bool = False
+) -> dict[str, list[str] | np.ndarray]:
+    """Collect per-commit columns, diffing only commits missing from ``cache``."""
+    args = ["log", "--all", f"--since={since}", "--format=%H%x1f%an%x1f%ct"]
+    if not include_merges:
+        args.append("--no-merges")
+
+    hashes, authors, timestamps = [], [], []
+    for line in iter_git_lines(repo_path, args):
+        sha, author, committed_date = line.split("\x1f")
+        seconds = int(committed_date)
+        hashes.append(sha)
+        authors.append(author)
+        # Local wall-clock seconds, matching datetime.fromtimestamp().
+        timestamps.append(seconds + time.localtime(seconds).tm_gmtoff)
+
+    stats = cached_stats(cache, hashes)
+    missing = [sha for sha in hashes if sha not in stats]
+    if missing:
+        fresh = diff_stats(repo_path, missing)
+        boundary = shallow_commits(repo_path)
+        cache.executemany(
+            "INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?)",
+            ((sha, *v) for sha, v in fresh.items() if sha not in boundary),
         )
+        cache.commit()
+        stats.update(fresh)
+    insertions, deletions, files = zip(*(stats[sha] for sha in hashes)) if hashes else ((), (), ())
+
+    return {
+        "hash": hashes,
+        "author": authors,
+        "timestamp": np.asarray(timestamps, dtype=np.int64),
+        "insertions": np.asarray(insertions, dtype=np.int32),
+        "deletions": np.asarray(deletions, dtype=np.int32),
+        "files": np.asarray(files, dtype=np.int32),
+    }
 
-    df = pd.DataFrame(commits)
-    if df.empty:
-        print("No commits found for the given time range")
-        return
-
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
 
-    daily = df.groupby(df["timestamp"].dt.date).size()
-    authors = df["author"].value_counts()
+def aggregate(commits: dict[str, list[str] | np.ndarray]) -> dict[str, dict]:
+    """Compute the dashboard's ``daily``, ``authors``, ``heatmap`` and ``churn``."""
+    seconds = commits["timestamp"]
+    days, seconds_of_day = np.divmod(seconds, 86400)
+    first_day = days.min()
+    day_index = days - first_day
+    day_labels = (first_day + np.arange(day_index.max() + 1)).astype("datetime64[D]").astype(str).tolist()
 
-    heatmap = (
-        df.groupby([df["timestamp"].dt.day_name(), df["timestamp"].dt.hour])
-        .size()
-        .unstack()
-        .fillna(0)
-    )
-    heatmap = heatmap.reindex(
-        ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
-        fill_value=0,
-    )
+    daily = np.bincount(day_index)
+    churn_insertions = np.bincount(day_index, weights=commits["insertions"]).astype(np.int64)
+    churn_deletions = np.bincount(day_index, weights=commits["deletions"]).astype(np.int64)
 
-    churn = (
-        df.set_index("timestamp")[["insertions", "deletions"]]
-        .resample("D")
-        .sum()
-        .fillna(0)
-        .astype(int)
-    )
+    weekday = (days + 3) % 7  # 1970-01-01 was a Thursday
+    heatmap = np.bincount(weekday * 24 + seconds_of_day // 3600, minlength=7 * 24).reshape(7, 24)
+    hours = [str(h) for h in range(24)]
 
-    out = {
-        "commits": commits,
-        "daily": {str(k): int(v) for k, v in daily.items()},
-        "authors": authors.astype(int).to_dict(),
-        "heatmap": {day: heatmap.loc[day].astype(int).to_dict() for day in heatmap.index},
+    return {
+        # Only days with commits, as a value count would report them.
+        "daily": {day: count for day, count in zip(day_labels, daily.tolist()) if count},
+        "authors": dict(Counter(commits["author"]).most_common()),
+        "heatmap": {day: dict(zip(hours, counts)) for day, counts in zip(WEEKDAYS, heatmap.tolist())},
         "churn": {
-            k.strftime("%Y-%m-%d"): {"insertions": int(row["insertions"]), "deletions": int(row["deletions"])}
-            for k, row in churn.iterrows()
+            day: {"insertions": ins, "deletions": dels}
+            for day, ins, dels in zip(day_labels, churn_insertions.tolist(), churn_deletions.tolist())
         },
     }
 
+
+def main() -> None:
+    args = parse_args()
+    repo_path = os.path.abspath(args.repo)
+    since = resolve_since(args.since)
+
+    with closing(open_cache(Path(args.cache))) as cache:
+        commits = collect_commits(repo_path, since, cache, args.include_merges)
+    if not commits["hash"]:
+        print("No commits found for the given time range")
+        return
+
+    records = [
+        CommitRecord(*fields)
+        for fields in zip(
+            commits["hash"],
+            commits["author"],
+            # orjson renders datetime64 as ISO 8601 itself, so no strings are formatted here.
+            commits["timestamp"].astype("datetime64[s]"),
+            commits["insertions"].tolist(),
+            commits["deletions"].tolist(),
+            commits["files"].tolist(),
+        )
+    ]
+
+    out = {"commits": records, **aggregate(commits)}
+
     out_path = Path(args.out)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    with out_path.open("w") as f:
-        json.dump(out, f, indent=2)
+    # orjson writes UTF-8 bytes directly and handles numpy scalars itself.
+    out_path.write_bytes(orjson.dumps(out, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     print(f"JSON data written to {out_path}")
 
 
@@ -1,20 +1,31 @@
 #!/usr/bin/env python3
-import os, argparse, subprocess
+import os, argparse, shutil, sqlite3, subprocess, time, zlib
+from collections.abc import Iterator
+from contextlib import closing
 from datetime import datetime, timedelta
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from pandas import DataFrame
+from pandas import DataFrame, Series
 import matplotlib.pyplot as plt
 import seaborn as sns
-from git import Repo
 
 sns.set_theme(style="darkgrid")
 
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Anything that changes what a cached row means goes into the stamp checked by open_cache.
+DIFF_FLAGS = ["--numstat", "--no-renames", "--diff-merges=first-parent"]
+CACHE_SCHEMA = ("CREATE TABLE IF NOT EXISTS stats"
+                " (sha TEXT PRIMARY KEY, insertions INTEGER, deletions INTEGER, files INTEGER)")
+CACHE_VERSION = zlib.crc32(" ".join([CACHE_SCHEMA, *DIFF_FLAGS]).encode()) & 0x7FFFFFFF
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Generate Git activity report.")
     parser.add_argument("--repo", default=".", help="Path to Git repo")
     parser.add_argument("--since", default="3 months ago", help="Time range (e.g., '90 days ago')")
     parser.add_argument("--out", default=".gitreport", help="Output directory")
+    parser.add_argument("--include-merges", action="store_true", help="Count merge commits too")
     return parser.parse_args()
 
 def resolve_since(since_string: str) -> str:
@@ -24,117 +35,216 @@ def resolve_since(since_string: str) -> str:
     except:
         return since_string
 
-def run_git_command(cmd: str, repo_path: str) -> str:
-    return subprocess.run(cmd, cwd=repo_path, shell=True,
-                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
-                          text=True, check=False).stdout.strip()
+def run_git_command(cmd: str, repo_path: str, out_file: Path) -> None:
+    # git writes straight into the file, so large output never passes through Python.
+    with out_file.open("wb") as out:
+        subprocess.run(cmd, cwd=repo_path, shell=True,
+                       stdout=out, stderr=subprocess.DEVNULL, check=False)
+
+def iter_git_lines(repo_path: str, args: list[str], stdin: str | None = None) -> Iterator[str]:
+    # The context manager closes the pipes and reaps git even if the caller stops early.
+    with subprocess.Popen(["git", *args], cwd=repo_path, stdout=subprocess.PIPE,
+                          stdin=subprocess.PIPE if stdin is not None else None) as proc:
+        if stdin is not None:
+            proc.stdin.write(stdin.encode())  # git reads all of stdin before printing anything
+            proc.stdin.close()
+        for raw in proc.stdout:
+            yield raw.decode("utf-8", "replace").rstrip("\n")
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+def open_cache(path: Path) -> sqlite3.Connection:
+    # A commit's stats never change once it has its full history, so rows keyed by SHA stay valid across runs.
+    # A cache written with another schema or other diff flags is dropped rather than trusted.
+    con = sqlite3.connect(path)
+    if con.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+        con.execute("DROP TABLE IF EXISTS stats")
+        con.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+    con.execute(CACHE_SCHEMA)
+    return con
+
+def shallow_commits(repo_path: str) -> set[str]:
+    # Shallow-clone boundary commits diff as roots until the history is fetched, so their stats are not final.
+    shallow = Path(repo_path, list(iter_git_lines(repo_path, ["rev-parse", "--git-path", "shallow"]))[0])
+    return set(shallow.read_text().split()) if shallow.exists() else set()
+
+def cached_stats(con: sqlite3.Connection, shas: list[str]) -> dict[str, tuple[int, int, int]]:
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (sha TEXT PRIMARY KEY)")
+    con.execute("DELETE FROM wanted")
+    con.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((sha,) for sha in shas))
+    rows = con.execute("SELECT sha, insertions, deletions, files FROM stats JOIN wanted USING (sha)")
+    return {sha: (ins, dels, files) for sha, ins, dels, files in rows}
+
+def diff_stats(repo_path: str, shas: list[str]) -> dict[str, tuple[int, int, int]]:
+    # One `git log --no-walk --stdin` diffs exactly the requested commits.
+    args = ["log", "--stdin", "--no-walk=unsorted", *DIFF_FLAGS, "--format=%x01%H"]
+    stats = {}
+    counts = None
+    for line in iter_git_lines(repo_path, args, stdin="\n".join(shas) + "\n"):
+        if line.startswith("\x01"):
+            counts = stats[line[1:]] = [0, 0, 0]
+        elif line:
+            added, removed, _ = line.split("\t", 2)
+            counts[0] += int(added) if added != "-" else 0
+            counts[1] += int(removed) if removed != "-" else 0
+            counts[2] += 1
+    return {sha: tuple(counts) for sha, counts in stats.items()}
+
+def collect_commits(repo_path: str, since: str, cache: sqlite3.Connection, include_merges: bool = False) -> DataFrame:
+    # A header-only `git log` lists the commits; only those missing from the cache get diffed.
+    # Merges are filtered by git unless asked for, so they never reach the diff step.
+    args = ["log", "--all", f"--since={since}", "--format=%H%x1f%aN%x1f%ct"]  # %aN applies .mailmap
+    if not include_merges:
+        args.append("--no-merges")
+
+    hashes, authors, timestamps = [], [], []
+    for line in iter_git_lines(repo_path, args):
+        sha, author, committed_date = line.split("\x1f")
+        seconds = int(committed_date)
+        hashes.append(sha)
+        authors.append(author)
+        timestamps.append(seconds + time.localtime(seconds).tm_gmtoff)  # local wall clock
+
+    stats = cached_stats(cache, hashes)
+    missing = [sha for sha in hashes if sha not in stats]
+    if missing:
+        fresh = diff_stats(repo_path, missing)
+        boundary = shallow_commits(repo_path)
+        cache.executemany("INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?)",
+                          ((sha, *v) for sha, v in fresh.items() if sha not in boundary))
+        cache.commit()
+        stats.update(fresh)
+    insertions, deletions, files = zip(*(stats[sha] for sha in hashes)) if hashes else ((), (), ())
 
-def save_git_metadata(repo_path: str, since: str, output_dir: Path) -> tuple[Path, Path, Path]:
+    # One array per column, so the frame is built from typed arrays rather than row dicts.
+    return DataFrame({
+        "hash": hashes,
+        "author": authors,
+        "timestamp": pd.to_datetime(np.asarray(timestamps, dtype=np.int64), unit="s"),
+        "insertions": np.asarray(insertions, dtype=np.int32),
+        "deletions": np.asarray(deletions, dtype=np.int32),
+        "files": np.asarray(files, dtype=np.int32),
+    })
+
+def save_git_metadata(df: DataFrame, repo_path: str, since: str, output_dir: Path) -> tuple[Path, Path, Path]:
     log_file = output_dir / "log-graph.txt"
     shortlog_file = output_dir / "shortlog-summary.txt"
     stat_file = output_dir / "commit-stat-summary.txt"
 
-    log_file.write_text(run_git_command(f"git log --all --since='{since}' --graph --decorate --oneline", repo_path))
-    shortlog_file.write_text(run_git_command(f"git shortlog -sne --since='{since}' --all", repo_path))
-    stat_file.write_text(run_git_command(f"git log --since='{since}' --author='$(git config user.name)' --shortstat", repo_path))
+    # The graph is the one view git has to draw; the tables come from the commits already loaded.
+    run_git_command(f"git log --all --since='{since}' --graph --decorate --oneline", repo_path, log_file)
+    # Most commits first and ties by name, as `git shortlog -sn` orders them.
+    authors = df["author"].value_counts().sort_index().sort_values(ascending=False, kind="stable")
+    shortlog_file.write_text("".join(f"{count:>6}\t{author}\n" for author, count in authors.items()))
+    loc = df.groupby("author")[["insertions", "deletions", "files"]].sum()
+    stat_file.write_text(loc.sort_values("insertions", ascending=False).to_string() + "\n")
 
     return log_file, shortlog_file, stat_file
 
 def generate_markdown_summary(output_dir: Path, log_file: Path, shortlog_file: Path, stat_file: Path):
     md_path = Path(output_dir) / "summary.md"
-    md_path.write_text(
-        "# Git Activity Report\n\n"
-        "## Commit Graph\n"
-        "```\n"
-        f"{log_file.read_text()}\n"
-        "```\n\n"
-        "## Top Contributors\n"
-        "```\n"
-        f"{shortlog_file.read_text()}\n"
-        "```\n\n"
-        "## LOC Stats\n"
-        "```\n"
-        f"{stat_file.read_text()}\n"
-        "```\n\n"
-        "## Commits Over Time\n"
-        "![Commits](commits-over-time.png)\n\n"
-        "## Author Contribution\n"
-        "![Authors](authors.png)\n\n"
-        "## Commit Heatmap\n"
-        "![Heatmap](commit-heatmap.png)\n\n"
-        "## Code Churn\n"
-        "![LOC Effort](loc-effort.png)\n"
-    )
+    sections = [("Commit Graph", log_file), ("Top Contributors", shortlog_file), ("LOC Stats", stat_file)]
+    with md_path.open("wb") as md:
+        md.write(b"# Git Activity Report\n\n")
+        for title, path in sections:
+            md.write(f"## {title}\n```\n".encode())
+            # Copy in chunks; the commit graph of a large repo can run to megabytes.
+            with path.open("rb") as src:
+                shutil.copyfileobj(src, md)
+            md.write(b"```\n\n")  # every section file ends with a newline
+        md.write(
+            b"## Commits Over Time\n"
+            b"![Commits](commits-over-time.png)\n\n"
+            b"## Author Contribution\n"
+            b"![Authors](authors.png)\n\n"
+            b"## Commit Heatmap\n"
+            b"![Heatmap](commit-heatmap.png)\n\n"
+            b"## Code Churn\n"
+            b"![LOC Effort](loc-effort.png)\n"
+        )
     return md_path
 
-def convert_to_pdf(markdown_path: Path) -> None:
-    pdf_path = markdown_path.with_suffix(".pdf")
-    try:
-        subprocess.run([
-            "pandoc", str(markdown_path),
-            "-o", str(pdf_path),
-            "--resource-path", str(markdown_path.parent),
-            "--pdf-engine=xelatex"
-        ], check=True)
-        print(f"✅ PDF summary created: {pdf_path}")
-    except Exception as e:
-        print(f"⚠️  Pandoc not available or failed: {e}")
-
-def convert_to_html(markdown_path: Path) -> None:
-    html_path = markdown_path.with_suffix(".html")
-    try:
-        subprocess.run(["pandoc", str(markdown_path), "-o", str(html_path)], check=True)
-        print(f"✅ HTML summary created: {html_path}")
-    except Exception as e:
-        print(f"⚠️  Pandoc not available or failed: {e}")
+def convert_summary(markdown_path: Path) -> None:
+    # The PDF (xelatex) and HTML conversions are independent; run both pandocs at once.
+    outputs = {
+        "PDF": (markdown_path.with_suffix(".pdf"),
+                ["--resource-path", str(markdown_path.parent), "--pdf-engine=xelatex"]),
+        "HTML": (markdown_path.with_suffix(".html"), []),
+    }
+    running = []
+    for kind, (out_path, extra) in outputs.items():
+        try:
+            proc = subprocess.Popen(["pandoc", str(markdown_path), "-o", str(out_path), *extra])
+            running.append((kind, out_path, proc))
+        except Exception as e:
+            print(f"⚠️  Pandoc not available or failed: {e}")
+    for kind, out_path, proc in running:
+        if proc.wait() == 0:
+            print(f"✅ {kind} summary created: {out_path}")
+        else:
+            print(f"⚠️  Pandoc not available or failed: {subprocess.CalledProcessError(proc.returncode, proc.args)}")
+
+def plot_commits(daily: Series, path: Path) -> None:
+    fig, ax = plt.subplots(figsize=(14, 6))
+    daily.plot(marker='o', ax=ax)
+    ax.set_title("Commits Per Day")
+    ax.set_ylabel("Commits")
+    ax.set_xlabel("Date")
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+def plot_authors(authors: Series, path: Path) -> None:
+    fig, ax = plt.subplots(figsize=(10, 6))
+    authors.plot(kind="barh", color="steelblue", ax=ax)
+    ax.set_title("Commit Contributions by Author")
+    ax.set_xlabel("Commits")
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+def plot_heatmap(heatmap_data: DataFrame, path: Path) -> None:
+    fig, ax = plt.subplots(figsize=(14, 5))
+    sns.heatmap(heatmap_data, cmap="YlGnBu", linewidths=0.5, cbar_kws={"label": "Commits"}, ax=ax)
+    ax.set_title("Commit Frequency Heatmap (Weekday × Hour)")
+    ax.set_xlabel("Hour of Day")
+    ax.set_ylabel("Day of Week")
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+def plot_churn(df_daily: DataFrame, path: Path) -> None:
+    # Dense churn areas rasterize faster with full path simplification and chunked Agg paths.
+    with plt.rc_context({"path.simplify_threshold": 1.0, "agg.path.chunksize": 10000}):
+        fig, ax = plt.subplots(figsize=(14, 6))
+        df_daily.plot.area(stacked=False, alpha=0.6, ax=ax)
+        ax.set_title("Code Churn Over Time (Insertions vs Deletions)")
+        ax.set_ylabel("Lines of Code")
+        ax.set_xlabel("Date")
+        ax.tick_params(axis="x", labelrotation=45)
+        ax.legend(["Insertions", "Deletions"])
+        fig.tight_layout()
+        fig.savefig(path)
+        plt.close(fig)
+
+def weekday_hour_counts(timestamps: Series) -> np.ndarray:
+    # Integer weekday/hour straight from epoch seconds; names only label the 7 rows.
+    seconds = timestamps.to_numpy().astype("datetime64[s]").astype(np.int64)
+    weekday = (seconds // 86400 + 3) % 7  # 1970-01-01 was a Thursday
+    hour = seconds // 3600 % 24
+    return np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24)
 
 def generate_visuals(df: DataFrame, output_dir: Path) -> None:
-    # Commits over time
-    plt.figure(figsize=(14, 6))
-    df.groupby("date").size().plot(marker='o')
-    plt.title("Commits Per Day")
-    plt.ylabel("Commits")
-    plt.xlabel("Date")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(output_dir / "commits-over-time.png")
-    plt.close()
-
-    # Authors
-    plt.figure(figsize=(10, 6))
-    df["author"].value_counts().plot(kind="barh", color="steelblue")
-    plt.title("Commit Contributions by Author")
-    plt.xlabel("Commits")
-    plt.tight_layout()
-    plt.savefig(output_dir / "authors.png")
-    plt.close()
-
-    # Heatmap of activity
-    heatmap_data = df.groupby(["dow", "hour"]).size().unstack().fillna(0)
-    heatmap_data = heatmap_data.reindex(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"])
-
-    plt.figure(figsize=(14, 5))
-    sns.heatmap(heatmap_data, cmap="YlGnBu", linewidths=0.5, cbar_kws={"label": "Commits"})
-    plt.title("Commit Frequency Heatmap (Weekday × Hour)")
-    plt.xlabel("Hour of Day")
-    plt.ylabel("Day of Week")
-    plt.tight_layout()
-    plt.savefig(output_dir / "commit-heatmap.png")
-    plt.close()
-
-    # Insertions/Deletions per day
-    df_daily = df.set_index("timestamp").resample("D")[["insertions", "deletions"]].sum()
-
-    plt.figure(figsize=(14, 6))
-    df_daily.plot.area(stacked=False, alpha=0.6, ax=plt.gca())
-    plt.title("Code Churn Over Time (Insertions vs Deletions)")
-    plt.ylabel("Lines of Code")
-    plt.xlabel("Date")
-    plt.xticks(rotation=45)
-    plt.legend(["Insertions", "Deletions"])
-    plt.tight_layout()
-    plt.savefig(output_dir / "loc-effort.png")
-    plt.close()
+    charts = [
+        (plot_commits, df["timestamp"].dt.floor("D").value_counts().sort_index(), "commits-over-time.png"),
+        (plot_authors, df["author"].value_counts(), "authors.png"),
+        (plot_heatmap, DataFrame(weekday_hour_counts(df["timestamp"]), index=WEEKDAYS), "commit-heatmap.png"),
+        (plot_churn, df.set_index("timestamp").resample("D")[["insertions", "deletions"]].sum(), "loc-effort.png"),
+    ]
+
+    for plot, data, name in charts:
+        plot(data, output_dir / name)
 
 def main() -> None:
     args = parse_args()
@@ -142,34 +252,18 @@ def main() -> None:
     output_dir = Path(args.out).expanduser().resolve()
     os.makedirs(str(output_dir), exist_ok=True)
 
-    repo = Repo(repo_path)
     since = resolve_since(args.since)
 
-    commits = []
-    for commit in repo.iter_commits('--all', since=since):
-        commits.append({
-            "hash": commit.hexsha,
-            "author": commit.author.name,
-            "timestamp": datetime.fromtimestamp(commit.committed_date),
-            "insertions": commit.stats.total["insertions"],
-            "deletions": commit.stats.total["deletions"],
-            "files": commit.stats.total["files"],
-        })
-
-    df = pd.DataFrame(commits)
+    with closing(open_cache(output_dir / "cache.sqlite")) as cache:
+        df = collect_commits(repo_path, since, cache, args.include_merges)
     if df.empty:
         print("⚠️ No commits found for the given time range.")
         return
 
-    df["date"] = df["timestamp"].dt.date
-    df["hour"] = df["timestamp"].dt.hour
-    df["dow"] = df["timestamp"].dt.day_name()
-
     generate_visuals(df, output_dir)
-    log_file, shortlog_file, stat_file = save_git_metadata(repo_path, since, output_dir)
+    log_file, shortlog_file, stat_file = save_git_metadata(df, repo_path, since, output_dir)
     md_path = generate_markdown_summary(output_dir, log_file, shortlog_file, stat_file)
-    convert_to_pdf(md_path)
-    convert_to_html(md_path)
+    convert_summary(md_path)
     print(f"✅ All output saved to: {output_dir}")
 
 if __name__ == "__main__":